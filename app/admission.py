@@ -0,0 +1,352 @@
+import os
+import math
+import time
+import asyncio
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MAX_RUNNING = int(os.getenv("MAX_CONCURRENT_RUNS", "4"))
+MAX_RUNNING_PER_CLIENT = int(os.getenv("MAX_RUNS_PER_CLIENT", "2"))
+MAX_QUEUED = int(os.getenv("MAX_QUEUED_RUNS", "16"))
+QUEUE_TIMEOUT = float(os.getenv("QUEUE_TIMEOUT_SECONDS", "30"))
+RUNS_PER_MINUTE_PER_CLIENT = float(os.getenv("RUNS_PER_MINUTE_PER_CLIENT", "10"))
+RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "5"))
+# X-Client-Id is caller-controlled, so it is only honoured from these proxy addresses.
+TRUSTED_PROXIES = {h.strip() for h in os.getenv("TRUSTED_PROXIES", "").split(",") if h.strip()}
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+
+def client_id(host: Optional[str], header_value: Optional[str]) -> str:
+    """Key a request by remote address; use X-Client-Id only when sent by a trusted proxy."""
+    if header_value and host in TRUSTED_PROXIES:
+        return header_value
+    return host or "anonymous"
+
+class AdmissionRejected(Exception):
+    """Raised when a run cannot be admitted. Maps to a 429/503 with Retry-After."""
+
+    def __init__(self, status_code: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """Bounds how many pipelines run at once, globally and per client.
+
+    - at most `max_running` runs execute; up to `max_queued` more wait in FIFO
+      order for at most `queue_timeout` seconds
+    - each client may hold at most `max_per_client` running+queued runs
+    - each client gets a token bucket of `per_minute` runs per minute, charged
+      when a run is admitted or queued and refunded if it leaves the queue
+      (timeout/cancel) without running
+    Rejections: 429 for per-client limits, 503 when the server is saturated.
+    """
+
+    def __init__(self, max_running: int, max_per_client: int, max_queued: int,
+                 queue_timeout: float, per_minute: float, retry_after: int):
+        self.max_running = max_running
+        self.max_per_client = max_per_client
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.per_minute = per_minute
+        self.retry_after = retry_after
+
+        self._lock = asyncio.Lock()
+        self._running = 0
+        # queued runs, oldest first; _release hands a freed slot to the head
+        self._waiters: Deque[asyncio.Future] = deque()
+        # only clients with running/queued runs; only clients with a non-full bucket
+        self._per_client: Dict[str, int] = {}
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._last_sweep = time.monotonic()
+
+        self._admitted = 0
+        self._rejected: Dict[str, int] = defaultdict(int)
+        self._max_queue_depth = 0
+
+    def _tokens(self, client_id: str, now: float) -> float:
+        capacity = max(self.per_minute, 1.0)
+        tokens, last = self._buckets.get(client_id, (capacity, now))
+        return min(capacity, tokens + (now - last) * self.per_minute / 60.0)
+
+    def _sweep_buckets(self, now: float) -> None:
+        """Drop buckets that have refilled; a missing bucket is a full one."""
+        if now - self._last_sweep < 60.0:
+            return
+        self._last_sweep = now
+        capacity = max(self.per_minute, 1.0)
+        for cid in [c for c in self._buckets if self._tokens(c, now) >= capacity]:
+            del self._buckets[cid]
+
+    def _reject(self, status_code: int, reason: str, retry_after: Optional[float] = None) -> AdmissionRejected:
+        self._rejected[reason] += 1
+        wait = self.retry_after if retry_after is None else max(1, math.ceil(retry_after))
+        return AdmissionRejected(status_code, reason, wait)
+
+    def _hold(self, client_id: str, tokens: float, now: float) -> None:
+        self._per_client[client_id] = self._per_client.get(client_id, 0) + 1
+        if self.per_minute > 0:
+            self._buckets[client_id] = (tokens - 1.0, now)
+
+    def _refund(self, client_id: str, now: float) -> None:
+        """Give back the token charged by _hold for a run that never started."""
+        if self.per_minute <= 0 or client_id not in self._buckets:
+            return
+        tokens = self._tokens(client_id, now) + 1.0
+        if tokens >= max(self.per_minute, 1.0):
+            del self._buckets[client_id]
+        else:
+            self._buckets[client_id] = (tokens, now)
+
+    def _drop(self, client_id: str) -> None:
+        self._per_client[client_id] -= 1
+        if self._per_client[client_id] <= 0:
+            del self._per_client[client_id]
+
+    def _hand_off(self) -> None:
+        while self._waiters and self._running < self.max_running:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                self._running += 1
+                self._admitted += 1
+                fut.set_result(None)
+
+    async def _acquire(self, client_id: str) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            self._sweep_buckets(now)
+            if self._per_client.get(client_id, 0) >= self.max_per_client:
+                raise self._reject(429, "client_concurrency")
+            tokens = self._tokens(client_id, now)
+            if self.per_minute > 0 and tokens < 1.0:
+                raise self._reject(429, "client_rate", (1.0 - tokens) * 60.0 / self.per_minute)
+
+            if self._running < self.max_running and not self._waiters:
+                self._running += 1
+                self._admitted += 1
+                self._hold(client_id, tokens, now)
+                return
+
+            if len(self._waiters) >= self.max_queued:
+                raise self._reject(503, "queue_full")
+
+            fut = asyncio.get_running_loop().create_future()
+            self._waiters.append(fut)
+            self._hold(client_id, tokens, now)
+            self._max_queue_depth = max(self._max_queue_depth, len(self._waiters))
+
+        try:
+            await asyncio.wait_for(fut, timeout=self.queue_timeout)
+        except BaseException as e:
+            async with self._lock:
+                if fut.done() and not fut.cancelled():
+                    # the slot was handed to us as we gave up; pass it on
+                    self._running -= 1
+                    self._hand_off()
+                else:
+                    fut.cancel()
+                    if fut in self._waiters:
+                        self._waiters.remove(fut)
+                self._drop(client_id)
+                self._refund(client_id, time.monotonic())
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._reject(503, "queue_timeout")
+            raise
+
+    async def _release(self, client_id: str) -> None:
+        async with self._lock:
+            self._running -= 1
+            self._drop(client_id)
+            self._hand_off()
+
+    @asynccontextmanager
+    async def admit(self, client_id: str) -> AsyncIterator[None]:
+        await self._acquire(client_id)
+        try:
+            yield
+        finally:
+            await self._release(client_id)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "running": self._running,
+            "queued": len(self._waiters),
+            "max_queue_depth": self._max_queue_depth,
+            "clients_active": len(self._per_client),
+            "rate_buckets": len(self._buckets),
+            "admitted": self._admitted,
+            "rejected": dict(self._rejected),
+            "limits": {
+                "max_running": self.max_running,
+                "max_per_client": self.max_per_client,
+                "max_queued": self.max_queued,
+                "queue_timeout_seconds": self.queue_timeout,
+                "runs_per_minute_per_client": self.per_minute,
+            },
+        }
+
+def _rate_limited(e: BaseException) -> Tuple[bool, Optional[float]]:
+    """Detect a provider 429 (openai.APIStatusError or httpx.HTTPStatusError) and its Retry-After."""
+    response = getattr(e, "response", None)
+    if _status(e) != 429:
+        return False, None
+    retry_after = None
+    headers = getattr(response, "headers", None) or {}
+    try:
+        retry_after = float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        pass
+    return True, retry_after
+
+def _status(e: BaseException) -> Optional[int]:
+    return getattr(e, "status_code", None) or getattr(getattr(e, "response", None), "status_code", None)
+
+def _transient(e: BaseException) -> bool:
+    """Errors worth retrying that aren't throttling: dropped connections, timeouts,
+    408/409 and 5xx (what the OpenAI SDK retries by default)."""
+    status = _status(e)
+    if status is not None:
+        return status in (408, 409) or status >= 500
+    # openai.APIConnectionError/APITimeoutError, httpx.TransportError; matched by
+    # name so this module doesn't import either SDK
+    names = {c.__name__ for c in type(e).__mro__}
+    return bool(names & {"APIConnectionError", "TransportError"}) or isinstance(e, (TimeoutError, ConnectionError))
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit for outbound provider calls.
+
+    On a 429 the limit is halved (at most once per throttle window) and new
+    calls hold off for the provider's Retry-After (or `backoff` seconds) before
+    taking a slot; each success grows the limit by ~1 per window of calls.
+    Clients must not retry 429s themselves (the OpenAI client is built with
+    max_retries=0), otherwise throttling is seen late; use `call`, which also
+    retries transient connection/5xx errors with exponential backoff.
+    """
+
+    def __init__(self, name: str, initial: int, maximum: int, minimum: int = 1, backoff: float = 1.0):
+        self.name = name
+        self.backoff = backoff
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+
+        self._cond = asyncio.Condition()
+        self._in_flight = 0
+        self._waiting = 0
+        self._blocked_until = 0.0
+        self._abandoned = 0
+
+        self._calls = 0
+        self._throttled = 0
+        self._retried = 0
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        self._waiting += 1
+        try:
+            while True:
+                # sleep out a throttle window without holding a slot
+                delay = self._blocked_until - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue
+                async with self._cond:
+                    await self._cond.wait_for(lambda: self._in_flight < int(self.limit))
+                    if self._blocked_until > time.monotonic():
+                        continue
+                    self._in_flight += 1
+                    break
+        finally:
+            self._waiting -= 1
+
+        try:
+            yield
+        except BaseException as e:
+            throttled, retry_after = _rate_limited(e)
+            if throttled:
+                self._throttled += 1
+                now = time.monotonic()
+                # calls in flight when the throttle hit all see the same 429s
+                if now >= self._blocked_until:
+                    self.limit = max(float(self.minimum), self.limit / 2)
+                self._blocked_until = max(self._blocked_until, now + (retry_after or self.backoff))
+            raise
+        else:
+            self._calls += 1
+            self.limit = min(float(self.maximum), self.limit + 1.0 / self.limit)
+        finally:
+            async with self._cond:
+                self._in_flight -= 1
+                self._cond.notify_all()
+
+    async def call(self, make: Callable[[], Awaitable[Any]], retries: int = 0, cancellable: bool = True) -> Any:
+        """Run `make()` in a slot, retrying 429s and transient errors up to `retries` times.
+
+        Pass cancellable=False when `make()` can't actually be stopped (e.g.
+        asyncio.to_thread): if the caller is cancelled, the slot stays held
+        until the underlying call finishes, so in_flight keeps matching real
+        provider concurrency. Such calls are reported as "abandoned".
+        """
+        for attempt in range(retries + 1):
+            try:
+                async with self.slot():
+                    if cancellable:
+                        return await make()
+                    task = asyncio.ensure_future(make())
+                    try:
+                        return await asyncio.shield(task)
+                    except asyncio.CancelledError:
+                        self._abandoned += 1
+                        try:
+                            await asyncio.shield(task)
+                        except BaseException:
+                            pass
+                        finally:
+                            self._abandoned -= 1
+                        raise
+            except Exception as e:
+                if attempt == retries:
+                    raise
+                if _rate_limited(e)[0]:
+                    # slot() waits out the throttle window on the next attempt
+                    self._retried += 1
+                elif _transient(e):
+                    self._retried += 1
+                    await asyncio.sleep(self.backoff * 2 ** attempt)
+                else:
+                    raise
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "limit": int(self.limit),
+            "in_flight": self._in_flight,
+            "waiting": self._waiting,
+            "calls": self._calls,
+            "throttled": self._throttled,
+            "retried": self._retried,
+            "abandoned": self._abandoned,
+            "blocked_for_seconds": round(max(0.0, self._blocked_until - time.monotonic()), 2),
+        }
+
+runs = AdmissionController(
+    max_running=MAX_RUNNING,
+    max_per_client=MAX_RUNNING_PER_CLIENT,
+    max_queued=MAX_QUEUED,
+    queue_timeout=QUEUE_TIMEOUT,
+    per_minute=RUNS_PER_MINUTE_PER_CLIENT,
+    retry_after=RETRY_AFTER,
+)
+llm_limiter = AdaptiveLimiter("llm", initial=int(os.getenv("LLM_CONCURRENCY", "8")), maximum=int(os.getenv("LLM_MAX_CONCURRENCY", "32")))
+search_limiter = AdaptiveLimiter("search", initial=int(os.getenv("SEARCH_CONCURRENCY", "4")), maximum=int(os.getenv("SEARCH_MAX_CONCURRENCY", "16")))
+
+def metrics() -> Dict[str, Any]:
+    return {
+        "runs": runs.metrics(),
+        "llm": llm_limiter.metrics(),
+        "search": search_limiter.metrics(),
+    }
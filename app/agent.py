@@ -1,5 +1,6 @@
 import os
 import json
+import asyncio
 from typing import Any, Dict, List, Optional
 
 from openai import OpenAI
@@ -7,9 +8,11 @@ from dotenv import load_dotenv
 
 from app.prompts import SYSTEM
 from app import tools as tool_impl
+from app.admission import llm_limiter, LLM_MAX_RETRIES
 
 load_dotenv()
-client = OpenAI()
+# retries (429s and transient errors) go through llm_limiter so it sees every throttle
+client = OpenAI(max_retries=0)
 MODEL = os.getenv("MODEL", "gpt-4.1-mini")
 
 TOOL_DEFS = [
@@ -98,6 +101,18 @@ async def _run_tool(name: str, args: Dict[str, Any]) -> Any:
         return await tool_impl.web_search(**args)
     raise ValueError(f"Unknown tool: {name}")
 
+async def _respond(**kwargs):
+    """Call the model off the event loop, under the adaptive LLM concurrency limit.
+
+    The worker thread can't be cancelled, so the limiter keeps its slot until
+    the request actually finishes.
+    """
+    return await llm_limiter.call(
+        lambda: asyncio.to_thread(client.responses.create, **kwargs),
+        retries=LLM_MAX_RETRIES,
+        cancellable=False,
+    )
+
 def _safe_get_text(response) -> str:
     final_text = ""
     for o in response.output:
@@ -115,6 +130,30 @@ def _ensure_keys(base: Dict[str, Any]) -> Dict[str, Any]:
     base.setdefault("verifier_report", {})
     return base
 
+# Sections the merged S7-S9 patch must contain, and the staged step that
+# re-generates each one if it is missing.
+MERGED_KEYS = {"cover_letter": "S7", "interview_pack": "S8", "verifier_report": "S9"}
+
+async def _company_overview(company_name: str, research_results: Dict[str, Any]) -> str:
+    """Write a 2-3 sentence overview from the research snippets."""
+    response = await _respond(
+        model=MODEL,
+        input=[
+            {"role": "system", "content": SYSTEM},
+            {"role": "user", "content": json.dumps({
+                "task": "Write a short company overview (2-3 sentences) based only on provided search snippets. If missing, write neutral.",
+                "company_name": company_name,
+                "snippets": {
+                    "engineering_blog": (research_results.get("engineering_blog", {}).get("results", [])[:2] if research_results else []),
+                    "recent_news": (research_results.get("recent_news", {}).get("results", [])[:2] if research_results else []),
+                },
+                "output_format": {"overview": "string"}
+            })}
+        ],
+        tool_choice="none",
+    )
+    return json.loads(_safe_get_text(response)).get("overview", "")
+
 async def _llm_step(step_id: str, step_name: str, working: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
     """Ask the model to produce a JSON patch for the working output."""
     prompt = {
@@ -124,7 +163,7 @@ async def _llm_step(step_id: str, step_name: str, working: Dict[str, Any], conte
         "working_output_so_far": working,
     }
 
-    response = client.responses.create(
+    response = await _respond(
         model=MODEL,
         input=[
             {"role": "system", "content": SYSTEM},
@@ -145,6 +184,7 @@ Expected patch keys depend on the step:
 - S7 -> cover_letter
 - S8 -> interview_pack
 - S9 -> verifier_report
+- S7-S9 -> cover_letter, interview_pack, verifier_report, company_overview (string, 2-3 sentences from research_results only)
 """}
         ],
         tools=TOOL_DEFS,
@@ -154,14 +194,16 @@ Expected patch keys depend on the step:
     patch_text = _safe_get_text(response)
     return json.loads(patch_text)
 
-async def run_copilot(job_text: str, resume_text: str, company_name: Optional[str], role_title: Optional[str], job_url: Optional[str]) -> Dict[str, Any]:
+async def run_copilot(job_text: str, resume_text: str, company_name: Optional[str], role_title: Optional[str], job_url: Optional[str], profile: str = "staged") -> Dict[str, Any]:
     # ----- State machine -----
-    plan = tool_impl.create_action_plan(company_name=company_name, role_title=role_title, job_url=job_url)
+    plan = tool_impl.create_action_plan(company_name=company_name, role_title=role_title, job_url=job_url, profile=profile)
     steps: List[Dict[str, Any]] = plan["steps"]
 
     working: Dict[str, Any] = _ensure_keys({})
     execution_log: Dict[str, Any] = {
         "plan_id": plan["plan_id"],
+        "profile": plan["profile"],
+        "llm_calls": 0,
         "steps": [],
     }
 
@@ -233,7 +275,8 @@ async def run_copilot(job_text: str, resume_text: str, company_name: Optional[st
                     # if flagged, ask LLM to rewrite only flagged bullets
                     if report.get("flagged_count", 0) > 0:
                         flagged_points = [f["point"] for f in report["flagged"]]
-                        response = client.responses.create(
+                        execution_log["llm_calls"] += 1
+                        response = await _respond(
                             model=MODEL,
                             input=[
                                 {"role": "system", "content": SYSTEM},
@@ -278,40 +321,87 @@ async def run_copilot(job_text: str, resume_text: str, company_name: Optional[st
                     raise ValueError(f"Unhandled tool step: {tool}")
 
             else:
-                # LLM steps (S4/S5/S7/S8/S9)
-                patch = await _llm_step(sid, name, working, {
+                # LLM steps (S4/S5/S7/S8/S9, or merged S7-S9)
+                step_context = {
                     **context,
                     "ats_keywords": keywords,
                     "resume_claims": resume_claims,
                     "research_results": research_results,
-                })
+                }
+                split_into = step.get("split_into")
+                patch: Dict[str, Any] = {}
+                if not split_into:
+                    execution_log["llm_calls"] += 1
+                    patch = await _llm_step(sid, name, working, step_context)
+                else:
+                    # Only content problems split the merged step; transport and
+                    # rate-limit errors are retried by _respond and otherwise
+                    # propagate instead of tripling the load.
+                    execution_log["llm_calls"] += 1
+                    try:
+                        patch = await _llm_step(sid, name, working, step_context)
+                    except json.JSONDecodeError as e:
+                        log_entry["split_reason"] = f"invalid JSON: {e}"
+                    if not isinstance(patch, dict):
+                        log_entry["split_reason"] = "merged reply is not a JSON object"
+                        patch = {}
+                    missing = [k for k in MERGED_KEYS if k not in patch]
+                    if missing:
+                        log_entry.setdefault("split_reason", f"merged patch missing keys: {missing}")
+                        # keep the sections that came back; re-generate only the missing ones
+                        overview = patch.pop("company_overview", None)
+                        for k, v in patch.items():
+                            working[k] = v
+                        # the staged steps see the overview from S4 on; give the split ones the same
+                        research = working.get("company_research")
+                        if research and not research.get("overview") and company_name:
+                            if not overview:
+                                execution_log["llm_calls"] += 1
+                                try:
+                                    overview = await _company_overview(company_name, research_results)
+                                except Exception as ov_e:
+                                    log_entry["overview_error"] = str(ov_e)
+                            research["overview"] = overview or ""
+                        redo = {MERGED_KEYS[k] for k in missing}
+                        log_entry["split"] = []
+                        for sub in split_into:
+                            if sub["id"] not in redo:
+                                continue
+                            sub_entry = {"id": sub["id"], "name": sub["name"], "kind": sub["kind"], "status": "pending"}
+                            try:
+                                execution_log["llm_calls"] += 1
+                                sub_patch = await _llm_step(sub["id"], sub["name"], working, step_context)
+                                for k, v in sub_patch.items():
+                                    working[k] = v
+                                patch.update(sub_patch)
+                                sub_entry["status"] = "done"
+                                sub_entry["output_summary"] = {"patched_keys": list(sub_patch.keys())}
+                            except Exception as sub_e:
+                                sub_entry["status"] = "failed"
+                                sub_entry["error"] = str(sub_e)
+                            log_entry["split"].append(sub_entry)
+
+                overview = patch.pop("company_overview", None)
                 # merge patch
                 for k, v in patch.items():
                     working[k] = v
+                if overview and working.get("company_research") and not working["company_research"].get("overview"):
+                    working["company_research"]["overview"] = overview
 
                 # Special: if company overview is empty but we have research, fill it quickly in S4 or S7 pass.
-                if working.get("company_research") and not working["company_research"].get("overview") and company_name:
+                # The merged profile writes it inside S7-S9 and only falls back to a separate call there.
+                overview_due = plan["profile"] == "staged" or bool(split_into)
+                if overview_due and working.get("company_research") and not working["company_research"].get("overview") and company_name:
                     # allow LLM to write a 2-3 sentence overview from research snippets
-                    response = client.responses.create(
-                        model=MODEL,
-                        input=[
-                            {"role": "system", "content": SYSTEM},
-                            {"role": "user", "content": json.dumps({
-                                "task": "Write a short company overview (2-3 sentences) based only on provided search snippets. If missing, write neutral.",
-                                "company_name": company_name,
-                                "snippets": {
-                                    "engineering_blog": (research_results.get("engineering_blog", {}).get("results", [])[:2] if research_results else []),
-                                    "recent_news": (research_results.get("recent_news", {}).get("results", [])[:2] if research_results else []),
-                                },
-                                "output_format": {"overview": "string"}
-                            })}
-                        ],
-                        tool_choice="none",
-                    )
-                    ov = json.loads(_safe_get_text(response)).get("overview", "")
-                    working["company_research"]["overview"] = ov
+                    execution_log["llm_calls"] += 1
+                    working["company_research"]["overview"] = await _company_overview(company_name, research_results)
 
                 log_entry["status"] = "done"
+                failed_subs = [x["id"] for x in log_entry.get("split", []) if x["status"] == "failed"]
+                if failed_subs:
+                    # partial: some sections were produced, failed: none were
+                    log_entry["status"] = "partial" if any(k in patch for k in MERGED_KEYS) else "failed"
+                    log_entry["error"] = f"split steps failed: {failed_subs}"
                 log_entry["output_summary"] = {"patched_keys": list(patch.keys())}
 
         except Exception as e:
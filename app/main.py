@@ -1,4 +1,4 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request
 import tempfile
 
 from app.schemas import RunRequest, RunResponse, ScoreRequest, DiffResponse
@@ -8,6 +8,7 @@ from app.ingest import extract_text
 from app.scoring import ats_score
 from app.diffs import unified_diff
 from app.tools import extract_keywords
+from app import admission
 
 app = FastAPI(title="Agentic Job Application Copilot")
 
@@ -25,25 +26,35 @@ async def extract(file: UploadFile = File(...)):
     return {"filename": file.filename, "text": text}
 
 @app.post("/run", response_model=RunResponse)
-async def run(req: RunRequest):
-    job_id = upsert_job(
-        job_url=req.job_url,
-        company=req.company_name,
-        role=req.role_title,
-        jd_text=req.job_text,
-    )
+async def run(req: RunRequest, request: Request):
+    client_id = admission.client_id(request.client.host if request.client else None, request.headers.get("x-client-id"))
+    try:
+        async with admission.runs.admit(client_id):
+            job_id = upsert_job(
+                job_url=req.job_url,
+                company=req.company_name,
+                role=req.role_title,
+                jd_text=req.job_text,
+            )
 
-    payload = await run_copilot(
-        job_text=req.job_text,
-        resume_text=req.resume_text,
-        company_name=req.company_name,
-        role_title=req.role_title,
-        job_url=req.job_url,
-    )
+            payload = await run_copilot(
+                job_text=req.job_text,
+                resume_text=req.resume_text,
+                company_name=req.company_name,
+                role_title=req.role_title,
+                job_url=req.job_url,
+                profile=req.profile,
+            )
 
-    run_id = save_artifact(job_id, payload)
+            run_id = save_artifact(job_id, payload)
+    except admission.AdmissionRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.reason, headers={"Retry-After": str(e.retry_after)})
     return {**payload, "run_id": run_id, "job_id": job_id}
 
+@app.get("/metrics/admission")
+def admission_metrics():
+    return admission.metrics()
+
 @app.post("/score")
 def score(req: ScoreRequest):
     keywords = extract_keywords(req.job_text)
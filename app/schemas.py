@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Literal
 
 class RunRequest(BaseModel):
     job_text: str = Field(..., description="Job description text (paste from LinkedIn/JD)")
@@ -7,6 +7,7 @@ class RunRequest(BaseModel):
     company_name: Optional[str] = None
     role_title: Optional[str] = None
     job_url: Optional[str] = None
+    profile: Literal["staged", "merged"] = Field("staged", description="staged: one model call per S7/S8/S9; merged: one call for all three")
 
 class RunResponse(BaseModel):
     jd_summary: Dict[str, Any]
@@ -4,17 +4,31 @@ from typing import Dict, List, Any
 import httpx
 import uuid
 
+from app.admission import search_limiter
+
 TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
 
-def create_action_plan(company_name: str | None, role_title: str | None, job_url: str | None) -> Dict[str, Any]:
+# Execution profiles:
+#   - staged: one model call per generation step (S7, S8, S9)
+#   - merged: S7/S8/S9 (+ company overview) in a single multi-section call;
+#             if the reply is invalid JSON or misses sections, only the staged
+#             steps for the missing sections are re-run (provider errors are
+#             retried, not split)
+PROFILES = ("staged", "merged")
+
+def create_action_plan(company_name: str | None, role_title: str | None, job_url: str | None, profile: str = "staged") -> Dict[str, Any]:
     """Return a deterministic JSON plan the agent will execute.
     Each step has:
       - id
       - name
       - kind: tool|llm
-      - status: pending|done|skipped|failed
+      - status: pending|done|partial|skipped|failed
       - note: optional
+      - split_into: optional (merged steps only) staged steps to fall back to
     """
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown profile: {profile}")
+
     steps = [
         {"id": "S1", "name": "Extract ATS keywords from job text", "kind": "tool", "tool": "extract_keywords", "status": "pending"},
         {"id": "S2", "name": "Extract evidence claims from resume", "kind": "tool", "tool": "extract_resume_claims", "status": "pending"},
@@ -27,8 +41,16 @@ def create_action_plan(company_name: str | None, role_title: str | None, job_url
         {"id": "S8", "name": "Generate interview pack (STAR stories + Qs)", "kind": "llm", "status": "pending"},
         {"id": "S9", "name": "Produce verifier report (what was grounded vs neutralized)", "kind": "llm", "status": "pending"},
     ]
+    if profile == "merged":
+        generation = steps[6:]
+        steps = steps[:6] + [
+            {"id": "S7-S9", "name": "Write cover letter, interview pack and verifier report in one pass", "kind": "llm", "status": "pending",
+             "note": "Also writes the company overview. If the reply is invalid JSON or misses sections, re-runs S7/S8/S9 for the missing ones.",
+             "split_into": generation},
+        ]
     return {
         "plan_id": str(uuid.uuid4()),
+        "profile": profile,
         "context": {"company_name": company_name, "role_title": role_title, "job_url": job_url},
         "steps": steps,
     }
@@ -80,7 +102,7 @@ async def web_search(query: str, max_results: int = 5) -> Dict[str, Any]:
     if not TAVILY_API_KEY:
         return {"error": "Missing TAVILY_API_KEY", "query": query, "results": []}
 
-    async with httpx.AsyncClient(timeout=20) as client:
+    async with search_limiter.slot(), httpx.AsyncClient(timeout=20) as client:
         r = await client.post(
             "https://api.tavily.com/search",
             json={
@@ -4,6 +4,7 @@ export type RunRequest = {
   company_name?: string | null;
   role_title?: string | null;
   job_url?: string | null;
+  profile?: "staged" | "merged";
 };
 
 export type RunResponse = {
@@ -0,0 +1,68 @@
+"""Benchmark the staged vs merged execution profiles of run_copilot.
+
+Usage:
+    python -m scripts.bench_profiles job.txt resume.txt --company Acme --role "Backend Engineer" --runs 3
+"""
+import argparse
+import asyncio
+import json
+import time
+from pathlib import Path
+from statistics import mean
+from typing import Any, Dict, List
+
+from app.agent import run_copilot
+from app.tools import PROFILES
+
+async def _bench(profile: str, args: argparse.Namespace, job_text: str, resume_text: str) -> Dict[str, Any]:
+    timings: List[float] = []
+    calls: List[int] = []
+    splits = 0
+    failed = 0
+    for _ in range(args.runs):
+        t0 = time.perf_counter()
+        out = await run_copilot(
+            job_text=job_text,
+            resume_text=resume_text,
+            company_name=args.company,
+            role_title=args.role,
+            job_url=None,
+            profile=profile,
+        )
+        timings.append(time.perf_counter() - t0)
+        log = out["execution_log"]
+        calls.append(log["llm_calls"])
+        splits += sum(1 for s in log["steps"] if "split" in s)
+        for s in log["steps"]:
+            # a split merged step is judged by its staged sub-steps
+            if "split" in s:
+                failed += sum(1 for x in s["split"] if x["status"] == "failed")
+            elif s["status"] == "failed":
+                failed += 1
+    return {
+        "profile": profile,
+        "runs": args.runs,
+        "mean_seconds": round(mean(timings), 2),
+        "min_seconds": round(min(timings), 2),
+        "mean_llm_calls": round(mean(calls), 2),
+        "splits": splits,
+        "failed_steps": failed,
+    }
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("job_file")
+    parser.add_argument("resume_file")
+    parser.add_argument("--company", default=None)
+    parser.add_argument("--role", default=None)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    job_text = Path(args.job_file).read_text(encoding="utf-8")
+    resume_text = Path(args.resume_file).read_text(encoding="utf-8")
+
+    results = [await _bench(p, args, job_text, resume_text) for p in PROFILES]
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    asyncio.run(main())